@@ -1,5 +1,10 @@
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Max, Sum
+
+# Columns and computed values returned by the list endpoints, matching the keys of to_dict
+USER_LIST_FIELDS = ('id', 'name', 'balance')
+USER_LIST_ANNOTATIONS = {'last_transaction': Max('transactions__create_date')}
+TRANSACTION_LIST_FIELDS = ('id', 'create_date', 'value', 'user')
 
 
 class User(models.Model):
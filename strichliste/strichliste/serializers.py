@@ -22,12 +22,12 @@ class TransactionValueLimit(TransactionValueError):
 
 class TransactionValueHigh(TransactionValueLimit):
     def __str__(self):
-        return "transaction value of {} exceeds the transaction maximum of {}".format(self.value, self.limit)
+        return f"transaction value of {self.value} exceeds the transaction maximum of {self.limit}"
 
 
 class TransactionValueLow(TransactionValueLimit):
     def __str__(self):
-        return "transaction value of {} falls below the transaction minimum of {}".format(self.value, self.limit)
+        return f"transaction value of {self.value} falls below the transaction minimum of {self.limit}"
 
 
 class TransactionResultLimit(TransactionValueError):
@@ -39,18 +39,48 @@ class TransactionResultLimit(TransactionValueError):
 
 class TransactionResultHigh(TransactionResultLimit):
     def __str__(self):
-        return ("transaction value of {trans_val} leads to an overall account balance of {new} "
-                "which goes beyond the upper account limit of {limit}").format(trans_val=self.value,
-                                                                               new=self.result,
-                                                                               limit=self.limit)
+        return (f"transaction value of {self.value} leads to an overall account balance of {self.result} "
+                f"which goes beyond the upper account limit of {self.limit}")
 
 
 class TransactionResultLow(TransactionResultLimit):
     def __str__(self):
-        return ("transaction value of {trans_val} leads to an overall account balance of {new} "
-                "which goes below the lower account limit of {limit}").format(trans_val=self.value,
-                                                                              new=self.result,
-                                                                              limit=self.limit)
+        return (f"transaction value of {self.value} leads to an overall account balance of {self.result} "
+                f"which goes below the lower account limit of {self.limit}")
+
+
+def check_transaction_value(value):
+    """Check a transaction value against the configured transaction boundaries
+
+    :param value: Value of the transaction
+    :raises TransactionValueError: If the value is zero or outside of the boundaries
+    """
+    config = settings.APP_CONFIG
+    max_transaction = config.upper_transaction_boundary
+    min_transaction = config.lower_transaction_boundary
+    if value == 0:
+        raise TransactionValueZero("value must not be zero")
+    elif value > max_transaction:
+        raise TransactionValueHigh(value, max_transaction)
+    elif value < min_transaction:
+        raise TransactionValueLow(value, min_transaction)
+
+
+def check_account_balance(balance, value):
+    """Check the balance resulting from a transaction against the configured account boundaries
+
+    :param balance: Current balance of the account
+    :param value: Value of the transaction
+    :raises TransactionResultLimit: If the resulting balance is outside of the boundaries
+    """
+    config = settings.APP_CONFIG
+    max_account = config.upper_account_boundary
+    min_account = config.lower_account_boundary
+    new_balance = balance + value
+    if new_balance > max_account:
+        raise TransactionResultHigh(value, max_account, new_balance)
+    elif new_balance < min_account:
+        raise TransactionResultLow(value, min_account, new_balance)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -65,28 +95,12 @@ class TransactionSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'value', 'create_date')
 
     def validate_value(self, value):
-        config = settings.APP_CONFIG
-        max_transaction = config.upper_transaction_boundary
-        min_transaction = config.lower_transaction_boundary
-        if value == 0:
-            raise TransactionValueZero("value must not be zero")
-        elif value > max_transaction:
-            raise TransactionValueHigh(value, max_transaction)
-        elif value < min_transaction:
-            raise TransactionValueLow(value, min_transaction)
+        check_transaction_value(value)
         return value
 
     def validate(self, transaction):
-        config = settings.APP_CONFIG
         user = transaction['user']
-        value = transaction['value']
         if user is None:
             raise KeyError("User not found")
-        max_account = config.upper_account_boundary
-        min_account = config.lower_account_boundary
-        new_balance = user.balance + value
-        if new_balance > max_account:
-            raise TransactionResultHigh(value, max_account, new_balance)
-        elif new_balance < min_account:
-            raise TransactionResultLow(value, min_account, new_balance)
+        check_account_balance(user.balance, transaction['value'])
         return transaction
@@ -1,13 +1,76 @@
 import django.db.utils
-from django.db import transaction
-from rest_framework import viewsets, status
+from django.db import connection, connections, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from rest_framework import serializers, viewsets, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 
 from strichliste import settings
 from .serializers import TransactionSerializer
 from .serializers import TransactionValueZero, TransactionValueError
-from .models import User, Transaction
+from .serializers import check_account_balance, check_transaction_value
+from .models import User, Transaction, USER_LIST_FIELDS, USER_LIST_ANNOTATIONS, TRANSACTION_LIST_FIELDS
+
+# Response bodies of errors without variable parts, shared between requests
+_ERR_NO_NAME = {'msg': "No name provided"}
+_ERR_NO_VALUE = {'msg': 'Value missing'}
+_ERR_TRANSACTION_NOT_FOUND = {'msg': 'transaction not found'}
+
+# Parses transaction values with the error messages of DRF, built once instead of per request
+_VALUE_FIELD = serializers.IntegerField()
+
+
+class StandardPagination(LimitOffsetPagination):
+    default_limit = 100
+    max_limit = 250
+    # Unfiltered tables with more estimated rows than this report the estimate as count
+    estimate_count_threshold = 100000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.count = self.get_count(queryset)
+        self.request = request
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return list(queryset[self.offset:self.offset + self.limit])
+
+    def get_count(self, queryset) -> int:
+        """Count the elements of a queryset
+
+        On PostgreSQL the planner statistics are used for unfiltered querysets on large tables,
+        as an exact COUNT has to scan the whole table. Filtered querysets are always counted exactly.
+
+        :param queryset: Queryset to count
+        :return: Number of elements
+        """
+        db_connection = connections[queryset.db]
+        if db_connection.vendor == 'postgresql' and not queryset.query.where:
+            with db_connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+                               [db_connection.ops.quote_name(queryset.model._meta.db_table)])
+                row = cursor.fetchone()
+            if row is not None and row[0] > self.estimate_count_threshold:
+                return row[0]
+        return queryset.count()
+
+
+def _paginate(queryset, request) -> dict:
+    """Paginate a queryset according to the limit and offset of a request
+
+    :param queryset: Queryset to paginate
+    :param request: HTTP Request
+    :return: Response data with the entries of the page and the pagination metadata
+    """
+    paginator = StandardPagination()
+    entries = paginator.paginate_queryset(queryset, request)
+    return {'entries': entries, 'limit': paginator.limit,
+            'offset': paginator.offset, 'overall_count': paginator.count}
 
 
 class UserViewSet(viewsets.ViewSet):
@@ -27,12 +90,16 @@ class UserViewSet(viewsets.ViewSet):
         name = request.data.get('name')
         mail_address = request.data.get('mail_address')
         if name is None:
-            return Response(data={'msg': "No name provided"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(data=_ERR_NO_NAME, status=status.HTTP_400_BAD_REQUEST)
+        if User.objects.filter(name=name).exists():
+            return Response(data={'msg': f"user {name} already exists"}, status=status.HTTP_409_CONFLICT)
         user = User(name=name, mail_address=mail_address)
         try:
-            user.save()
+            # Only reached by concurrent creation of the same name
+            with transaction.atomic():
+                user.save()
         except django.db.utils.IntegrityError:
-            return Response(data={'msg': "user {} already exists".format(name)}, status=status.HTTP_409_CONFLICT)
+            return Response(data={'msg': f"user {name} already exists"}, status=status.HTTP_409_CONFLICT)
         return Response(data=user.to_full_dict(), status=status.HTTP_201_CREATED)
 
     @staticmethod
@@ -42,14 +109,9 @@ class UserViewSet(viewsets.ViewSet):
         :param request: HTTP Request
         :return: Response
         """
-        paginator = LimitOffsetPagination()
-        paginator.max_limit = 250
-        paginator.default_limit = 100
-        users = paginator.paginate_queryset(User.objects.filter(active=True), request)
-        return Response(
-            data={'entries': [x.to_dict() for x in users], 'limit': paginator.limit,
-                  'offset': paginator.offset, 'overall_count': paginator.count},
-            status=status.HTTP_200_OK)
+        users = (User.objects.filter(active=True).values(*USER_LIST_FIELDS)
+                 .annotate(**USER_LIST_ANNOTATIONS).order_by('id'))
+        return Response(data=_paginate(users, request), status=status.HTTP_200_OK)
 
     @staticmethod
     def retrieve(request, pk=None) -> Response:
@@ -62,7 +124,7 @@ class UserViewSet(viewsets.ViewSet):
         try:
             user = User.objects.get(id=pk)
         except User.DoesNotExist:
-            return Response(data={'msg': 'user {} not found'.format(pk)}, status=status.HTTP_404_NOT_FOUND)
+            return Response(data={'msg': f'user {pk} not found'}, status=status.HTTP_404_NOT_FOUND)
         return Response(data=user.to_full_dict())
 
 
@@ -82,17 +144,13 @@ class UserTransactionViewSet(viewsets.ViewSet):
         :param user_pk: Primary key to identify a user
         :return: Response
         """
-        try:
-            user = User.objects.get(id=user_pk)
-        except User.DoesNotExist:
-            return Response(data={'msg': 'user {} not found'.format(user_pk)}, status=status.HTTP_404_NOT_FOUND)
-        paginator = LimitOffsetPagination()
-        paginator.max_limit = 250
-        paginator.default_limit = 100
-        transactions = paginator.paginate_queryset(Transaction.objects.filter(user=user), request)
-        return Response(data={'entries': [x.to_dict() for x in transactions], 'limit': paginator.limit,
-                              'offset': paginator.offset, 'overall_count': paginator.count},
-                        status=status.HTTP_200_OK)
+        transactions = (Transaction.objects.filter(user_id=user_pk).values(*TRANSACTION_LIST_FIELDS)
+                        .order_by('create_date', 'id'))
+        data = _paginate(transactions, request)
+        # Users with transactions exist, so only an empty result needs the existence check
+        if data['overall_count'] == 0 and not User.objects.filter(pk=user_pk).exists():
+            return Response(data={'msg': f'user {user_pk} not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data=data, status=status.HTTP_200_OK)
 
     @staticmethod
     def retrieve(request, pk=None, user_pk=None) -> Response:
@@ -103,12 +161,11 @@ class UserTransactionViewSet(viewsets.ViewSet):
         :param user_pk: Primary key to identify a user
         :return: Response
         """
-        user = User.objects.get(id=user_pk)
-        transactions = list(Transaction.objects.filter(user=user, id=pk))
-        if len(transactions) == 0:
-            return Response(data={'msg': 'transaction not found'}, status=status.HTTP_404_NOT_FOUND)
-        assert len(transactions) == 1, "Primary key is not unique"
-        return Response(data=transactions[0].to_dict())
+        try:
+            user_transaction = Transaction.objects.get(pk=pk, user_id=user_pk)
+        except Transaction.DoesNotExist:
+            return Response(data=_ERR_TRANSACTION_NOT_FOUND, status=status.HTTP_404_NOT_FOUND)
+        return Response(data=user_transaction.to_dict())
 
     @staticmethod
     @transaction.atomic
@@ -121,23 +178,28 @@ class UserTransactionViewSet(viewsets.ViewSet):
         """
         value = request.data.get('value')
         if value is None:
-            return Response(data={'msg': 'Value missing'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(data=_ERR_NO_VALUE, status=status.HTTP_400_BAD_REQUEST)
         try:
-            serializer = TransactionSerializer(data={'user': user_pk, 'value': value})
-            user = User.objects.get(pk=user_pk)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            user.balance += value
-            user.save()
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except KeyError as e:
-            return Response(data={'msg': e}, status=status.HTTP_404_NOT_FOUND)
+            value = _VALUE_FIELD.to_internal_value(value)
+        except ValidationError as e:
+            return Response(data={'value': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            check_transaction_value(value)
+            try:
+                # Lock the row until commit so the account boundary check sees the final balance
+                user = User.objects.select_for_update().get(pk=user_pk)
+            except User.DoesNotExist:
+                return Response(data={'msg': f'user {user_pk} not found'}, status=status.HTTP_404_NOT_FOUND)
+            check_account_balance(user.balance, value)
         except TransactionValueZero as e:
             return Response(data={'msg': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except TransactionValueError as e:
             return Response(data={'msg': str(e)}, status=status.HTTP_403_FORBIDDEN)
 
+        user_transaction = Transaction.objects.create(user=user, value=value)
+        User.objects.filter(pk=user_pk).update(balance=F('balance') + value)
+        return Response(TransactionSerializer(user_transaction).data, status=status.HTTP_201_CREATED)
+
 
 class TransactionViewSet(viewsets.ViewSet):
     """ViewSet for Transactions
@@ -153,13 +215,8 @@ class TransactionViewSet(viewsets.ViewSet):
         :param request: Request send from the client
         :return: Response
         """
-        paginator = LimitOffsetPagination()
-        paginator.max_limit = 250
-        paginator.default_limit = 100
-        transactions = paginator.paginate_queryset(Transaction.objects.all(), request)
-        return Response(data={'entries': [x.to_dict() for x in transactions], 'limit': paginator.limit,
-                              'offset': paginator.offset, 'overall_count': paginator.count},
-                        status=status.HTTP_200_OK)
+        transactions = Transaction.objects.values(*TRANSACTION_LIST_FIELDS).order_by('create_date', 'id')
+        return Response(data=_paginate(transactions, request), status=status.HTTP_200_OK)
 
     @staticmethod
     def retrieve(request, pk=None) -> Response:
@@ -169,25 +226,36 @@ class TransactionViewSet(viewsets.ViewSet):
         :param pk: Primary key to identify a transaction
         :return: Response
         """
-        transactions = list(Transaction.objects.filter(id=pk))
-        if len(transactions) == 0:
-            return Response(data={'msg': 'transaction not found'}, status=status.HTTP_404_NOT_FOUND)
-        assert len(transactions) == 1, "Private key should identify a single transaction"
-        return Response(data=transactions[0].to_dict())
+        try:
+            single_transaction = Transaction.objects.get(pk=pk)
+        except Transaction.DoesNotExist:
+            return Response(data=_ERR_TRANSACTION_NOT_FOUND, status=status.HTTP_404_NOT_FOUND)
+        return Response(data=single_transaction.to_dict())
 
 
 class DebugViewSet(viewsets.ViewSet):
 
     @staticmethod
+    @transaction.atomic
     def clear():
-        Transaction.objects.all().delete()
-        User.objects.all().delete()
+        tables = [Transaction._meta.db_table, User._meta.db_table]
+        quoted_tables = ', '.join(connection.ops.quote_name(table) for table in tables)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'TRUNCATE TABLE {quoted_tables} RESTART IDENTITY CASCADE')
+            else:
+                # Transactions first, their foreign key to users is protected
+                for table in tables:
+                    cursor.execute(f'DELETE FROM {connection.ops.quote_name(table)}')
+                if connection.vendor == 'sqlite':
+                    cursor.execute('DELETE FROM sqlite_sequence WHERE name IN (%s, %s)', tables)
         return "All cleared"
 
     @staticmethod
     def check_balance():
-        result = [user.balance == user.calc_balance() for user in User.objects.all()]
-        return 'Everything matches' if all(result) else 'Differences detected'
+        differences = (User.objects.annotate(calculated_balance=Coalesce(Sum('transactions__value'), 0))
+                       .exclude(balance=F('calculated_balance')).exists())
+        return 'Differences detected' if differences else 'Everything matches'
 
     @staticmethod
     def list(request):